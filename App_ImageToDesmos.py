@@ -1,116 +1,231 @@
 #!/usr/bin/env python3
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import cv2
 import numpy as np
 import potrace
 import PySimpleGUI as sg
-import tkinter as tk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
+# Samples per preview curve (upper bound; small curves use fewer)
+_MAX_SAMPLES = 50
+_MIN_SAMPLES = 8
 
-def bitmap_to_desmos_beziers(image_path, threshold=128, min_length=0, max_length=float('inf')):
+
+@lru_cache(maxsize=None)
+def _bernstein(n):
+    """Cubic Bernstein basis sampled at n points: (n,4)"""
+    t = np.linspace(0,1,n)
+    return np.column_stack([(1-t)**3, 3*(1-t)**2*t, 3*(1-t)*t**2, t**3])
+
+
+# Bernstein -> power basis: rows give a, b, c, d of a*t^3 + b*t^2 + c*t + d from p0..p3
+_BEZ2POW = np.array([
+    [-1, 3, -3, 1],
+    [3, -6, 3, 0],
+    [-3, 3, 0, 0],
+    [1, 0, 0, 0],
+], dtype=np.float64)
+
+
+# Larger images are downscaled to this many pixels on their longest side before tracing
+_MAX_DIM = 1024
+
+# Boolean buffer reused by the threshold pass, keyed by image shape
+_THRESH_BUF = {}
+
+
+def _threshold(gray, threshold):
+    """gray < threshold written into a reused boolean buffer"""
+    buf = _THRESH_BUF.get(gray.shape)
+    if buf is None:
+        _THRESH_BUF.clear()
+        buf = _THRESH_BUF[gray.shape] = np.empty(gray.shape, dtype=bool)
+    return np.less(gray, threshold, out=buf)
+
+
+def transform_and_filter(raw_pts, scale, cx, cy, min_len, max_len):
     """
-    Trace the input image with Potrace and return:
-    - desmos_segments: list of parametric tuples for Desmos
-    - preview_curves: list of control-point arrays for preview
+    Map raw (N,4,2) Potrace control points to centred pixel coords and return:
+    - keep: boolean mask of segments whose chord length is within [min_len, max_len]
+    - pixel_pts: (K,4) complex control points x + iy of the kept segments (y axis flipped)
+    - coeffs: (K,4) complex power-basis coefficients a, b, c, d of a*t^3 + b*t^2 + c*t + d
+    """
+    chord = raw_pts[:, 3] - raw_pts[:, 0]
+    length = np.hypot(chord[:, 0], chord[:, 1]) / scale
+    keep = (length >= min_len) & (length <= max_len)
+    raw_pts = raw_pts[keep]
 
-    Filters out segments shorter than min_length or longer than max_length.
+    pixel_pts = (raw_pts[..., 0]/scale - cx) + 1j*(cy - raw_pts[..., 1]/scale)
+    coeffs = pixel_pts @ _BEZ2POW.T
+    return keep, pixel_pts, coeffs
+
+
+def _desmos_number(v, precision, sign=False):
+    """
+    v with at most `precision` decimal places, in positional notation: Desmos has
+    no E-notation and reads 1.5e+02 as 1.5*e+2
+    """
+    return np.format_float_positional(v, precision=precision, fractional=True, trim='-', sign=sign)
+
+
+@lru_cache(maxsize=8)
+def _trace_cached(image_path, mtime, threshold):
+    """
+    Load and trace the image, returning (ctrl_pts, w, h) where ctrl_pts is a
+    read-only (N,4,2) array of raw Potrace control points p0,p1,p2,p3 in
+    original image units (images larger than _MAX_DIM are traced downscaled).
+    mtime is only part of the cache key, so an edited file is traced again.
     """
     gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
     if gray is None:
         raise FileNotFoundError(f"Cannot load '{image_path}'")
 
     h, w = gray.shape
-    cx, cy = w/2.0, h/2.0
+    if max(h, w) > _MAX_DIM:
+        f = _MAX_DIM / max(h, w)
+        gray = cv2.resize(gray, (max(1, round(w*f)), max(1, round(h*f))), interpolation=cv2.INTER_AREA)
+    gh, gw = gray.shape
 
-    bmp = potrace.Bitmap(gray < threshold)
+    bmp = potrace.Bitmap(_threshold(gray, threshold))
     paths = bmp.trace()
 
-    # Determine scale from raw coords
-    xs, ys = [], []
+    # Collect raw control points once: (N,4,2) as p0,p1,p2,p3 per segment
+    rows = []
     for curve in paths:
         start = curve.start_point
         for seg in curve:
-            pts = [start]
             if seg.is_corner:
-                pts.append(seg.c)
+                p1, p2 = start, seg.c
             else:
-                pts.extend([seg.c1, seg.c2])
-            pts.append(seg.end_point)
-            for pt in pts:
-                xs.append(pt.x)
-                ys.append(pt.y)
-            start = seg.end_point
-    if not xs:
-        return [], []
-    scale = ((max(xs)/w) + (max(ys)/h)) / 2.0 or 1.0
-
-    desmos_segments, preview_curves = [], []
-    for curve in paths:
-        start = curve.start_point
-        for seg in curve:
-            if seg.is_corner:
-                p0, p1, p2, p3 = start, start, seg.c, seg.end_point
-            else:
-                p0, p1, p2, p3 = start, seg.c1, seg.c2, seg.end_point
-
-            # Convert to pixel coords & center
-            def loc(pt):
-                x = pt.x/scale - cx
-                y = cy - pt.y/scale
-                return x, y
-            pts_pixel = [loc(p) for p in (p0, p1, p2, p3)]
-
-            # Compute segment length
-            (x0, y0), _, _, (x3, y3) = pts_pixel
-            length = np.hypot(x3-x0, y3-y0)
-            # Filter by length range
-            if length < min_length or length > max_length:
-                start = seg.end_point
-                continue
-
-            # Keep for preview drawing
-            preview_curves.append(np.array(pts_pixel))
-
-            # Build Desmos parametric tuple
-            Bx = (
-                f"(1-t)^3*{pts_pixel[0][0]}"
-                f"+3*(1-t)^2*t*{pts_pixel[1][0]}"
-                f"+3*(1-t)*t^2*{pts_pixel[2][0]}"
-                f"+t^3*{pts_pixel[3][0]}"
-            )
-            By = (
-                f"(1-t)^3*{pts_pixel[0][1]}"
-                f"+3*(1-t)^2*t*{pts_pixel[1][1]}"
-                f"+3*(1-t)*t^2*{pts_pixel[2][1]}"
-                f"+t^3*{pts_pixel[3][1]}"
-            )
-            domain = r"\left\{0 \le t \le 1\right\}"
-            desmos_segments.append(f"({Bx}, {By}) {domain}")
-            start = seg.end_point
-
-    return desmos_segments, preview_curves
-
-
-def copy_to_clipboard(text):
-    root = tk.Tk(); root.withdraw()
+                p1, p2 = seg.c1, seg.c2
+            end = seg.end_point
+            rows.append(((start.x, start.y), (p1.x, p1.y), (p2.x, p2.y), (end.x, end.y)))
+            start = end
+    ctrl_pts = np.array(rows, dtype=np.float64).reshape(-1, 4, 2)
+    if (gh, gw) != (h, w):
+        # Back to original image units so output coords don't depend on the downscale
+        ctrl_pts *= (w/gw, h/gh)
+    ctrl_pts.setflags(write=False)
+    return ctrl_pts, w, h
+
+
+def _filter_and_emit(ctrl_pts, w, h, min_length, max_length, precision):
+    """
+    Length-filter traced control points and build the Desmos/preview output,
+    plus the preview frame: (lo, hi) corners of the pixel-space extent of every
+    traced segment, taken before the length filter so it is the same for any
+    min/max length.
+    """
+    if not len(ctrl_pts):
+        return [], [], None
+    cx, cy = w/2.0, h/2.0
+
+    # Determine scale from raw coords
+    min_x, min_y = ctrl_pts.min(axis=(0, 1))
+    max_x, max_y = ctrl_pts.max(axis=(0, 1))
+    scale = ((max_x/w) + (max_y/h)) / 2.0 or 1.0
+    frame = (np.array([min_x/scale - cx, cy - max_y/scale]),
+             np.array([max_x/scale - cx, cy - min_y/scale]))
+
+    keep, pixel_pts, coeffs = transform_and_filter(ctrl_pts, scale, cx, cy, min_length, max_length)
+    if not keep.any():
+        return [], [], frame
+
+    # Keep for preview drawing
+    preview_curves = np.stack([pixel_pts.real, pixel_pts.imag], axis=-1)
+
+    # Build Desmos parametric tuples, coefficients rounded to `precision` decimal places.
+    # Anything below the printed resolution (e.g. 1e-13 residue on straight runs) is written as 0.
+    rows = np.hstack([coeffs.real, coeffs.imag])
+    rows[np.abs(rows) < 0.5 * 10.0**-precision] = 0.0
+    poly = "{}*t^3{}*t^2{}*t{}"
+    domain = r"\left\{0 \le t \le 1\right\}"
+    desmos_segments = []
+    for row in rows.tolist():
+        nums = [_desmos_number(v, precision, sign=i % 4 > 0) for i, v in enumerate(row)]
+        desmos_segments.append(f"({poly.format(*nums[:4])}, {poly.format(*nums[4:])}) {domain}")
+
+    return desmos_segments, preview_curves, frame
+
+
+def bitmap_to_desmos_beziers(image_path, threshold=128, min_length=0, max_length=float('inf'), precision=2):
+    """
+    Trace the input image with Potrace and return:
+    - desmos_segments: list of parametric tuples for Desmos
+    - preview_curves: (N,4,2) array of control points for preview
+    - frame: (lo, hi) corners of the pixel-space extent of all traced segments
+      before the length filter (None if nothing was traced); preview_curves
+      always lie within it
+
+    Filters out segments shorter than min_length or longer than max_length.
+    Coefficients are written with `precision` decimal places.
+    Traces are cached per (image, modification time, threshold), so changing
+    only the length range does not run Potrace again.
+    """
+    try:
+        mtime = os.path.getmtime(image_path)
+    except OSError:
+        raise FileNotFoundError(f"Cannot load '{image_path}'") from None
+    ctrl_pts, w, h = _trace_cached(image_path, mtime, threshold)
+    return _filter_and_emit(ctrl_pts, w, h, min_length, max_length, precision)
+
+
+def copy_to_clipboard(window, text):
+    root = window.TKroot
     root.clipboard_clear(); root.clipboard_append(text)
-    root.update(); root.destroy()
+    root.update()
+
+
+def update_tk(canvas, curves, frame, drawn, min_px=1.0, margin=10):
+    """
+    Redraw the preview on canvas. The (lo, hi) frame from
+    bitmap_to_desmos_beziers is fitted and centred on the canvas, so a curve
+    keeps its canvas coords when the length filter changes. drawn maps each polyline drawn by the previous call
+    to its line item: unchanged polylines keep their item untouched so Tk only
+    repaints what changed, stale items are moved to new polylines with
+    canvas.coords, and any leftovers are deleted.
+    """
+    curves = np.asarray(curves)
+    if not len(curves):
+        canvas.delete('curve')
+        drawn.clear()
+        return
 
+    # World -> canvas affine: fit the frame into the canvas, y axis down
+    width, height = int(canvas['width']), int(canvas['height'])
+    lo, hi = frame
+    span_x, span_y = hi - lo
+    px_per_unit = min((width - 2*margin) / (span_x or 1.0), (height - 2*margin) / (span_y or 1.0))
+    curves = (curves - (lo + hi)/2) * (px_per_unit, -px_per_unit) + (width/2, height/2)
 
-def draw_figure(canvas, curves):
-    fig, ax = plt.subplots(figsize=(6,6))
-    for pts in curves:
-        t = np.linspace(0,1,50)
-        x = (1-t)**3*pts[0,0] + 3*(1-t)**2*t*pts[1,0] + 3*(1-t)*t**2*pts[2,0] + t**3*pts[3,0]
-        y = (1-t)**3*pts[0,1] + 3*(1-t)**2*t*pts[1,1] + 3*(1-t)*t**2*pts[2,1] + t**3*pts[3,1]
-        ax.plot(x, y, linewidth=1)
-    ax.set_aspect('equal', 'box')
-    ax.axis('off')
-    fig_canvas = FigureCanvasTkAgg(fig, master=canvas)
-    fig_canvas.draw()
-    fig_canvas.get_tk_widget().pack(fill='both', expand=1)
-    return fig_canvas
+    # Skip curves below min_px and sample the rest according to their size
+    span = curves.max(axis=1) - curves.min(axis=1)
+    diag = np.hypot(span[:, 0], span[:, 1])
+    visible = diag >= min_px
+    curves, diag = curves[visible], diag[visible]
+    samples = np.clip((diag/4).astype(int), _MIN_SAMPLES, _MAX_SAMPLES)
+    lines = {}
+    for n in np.unique(samples):
+        for line in np.einsum('tk,nkd->ntd', _bernstein(int(n)), curves[samples == n]).round(1):
+            lines[line.tobytes()] = line
+
+    kept = {key: item for key, item in drawn.items() if key in lines}
+    stale = [item for key, item in drawn.items() if key not in lines]
+    for key, line in lines.items():
+        if key in kept:
+            continue
+        coords = line.ravel().tolist()
+        if stale:
+            item = stale.pop()
+            canvas.coords(item, coords)
+        else:
+            item = canvas.create_line(coords, fill='black', tags='curve')
+        kept[key] = item
+    canvas.delete(*stale)
+    drawn.clear()
+    drawn.update(kept)
 
 
 def main():
@@ -123,37 +238,66 @@ def main():
             tooltip='Ignore curve segments shorter than this length.')],
         [sg.Text('Max length:'), sg.Slider((0,2000), 1000, 10, orientation='h', key='-MAX-',
             tooltip='Ignore curve segments longer than this length.')],
+        [sg.Text('Precision:'), sg.Slider((0,6), 2, 1, orientation='h', key='-PREC-',
+            tooltip='Decimal places per coefficient in the output (lower = shorter output).')],
+        [sg.Text('Preview detail:'), sg.Slider((0,20), 1, 1, orientation='h', key='-DETAIL-',
+            tooltip='Skip preview curves smaller than this many screen pixels (higher = faster preview).')],
         [sg.Button('Preview'), sg.Button('Convert'), sg.Button('Copy'), sg.Button('Save'), sg.Button('Exit')],
-        [sg.Column([[sg.Canvas(key='-CANVAS-')]], size=(600,600)),
+        [sg.Column([[sg.Canvas(key='-CANVAS-', size=(600,600), background_color='white')]], size=(600,600)),
          sg.Multiline(key='-OUT-', size=(60,20), font=('Courier',10))]
     ]
     window = sg.Window('Desmos Bézier Exporter', layout, finalize=True)
     canvas_elem = window['-CANVAS-']; canvas = canvas_elem.TKCanvas
-    preview_plot = None
+    drawn = {}
+    last_output, last_bytes = None, b''
+    executor = ThreadPoolExecutor(max_workers=1)
+    closing = threading.Event()
+
+    def post_trace(future, kind):
+        # Runs on the worker thread; never post to a window that is being closed
+        if not closing.is_set():
+            window.write_event_value('-TRACE-DONE-', (kind, future))
 
     while True:
         event, vals = window.read()
         if event in (None, 'Exit'): break
-        if event == 'Preview':
+        if event in ('Preview', 'Convert'):
             path, thr, mn, mx = vals['-FILE-'], int(vals['-THR-']), int(vals['-MIN-']), int(vals['-MAX-'])
+            prec = int(vals['-PREC-'])
             if not path: sg.popup_error('Select image!'); continue
-            segs, curves = bitmap_to_desmos_beziers(path, threshold=thr, min_length=mn, max_length=mx)
-            if preview_plot: preview_plot.get_tk_widget().forget()
-            preview_plot = draw_figure(canvas, curves)
-        elif event == 'Convert':
-            path, thr, mn, mx = vals['-FILE-'], int(vals['-THR-']), int(vals['-MIN-']), int(vals['-MAX-'])
-            if not path: sg.popup_error('Select image!'); continue
-            segs, _ = bitmap_to_desmos_beziers(path, threshold=thr, min_length=mn, max_length=mx)
-            window['-OUT-'].update("\n".join(segs))
+            # Trace off the GUI thread; the result comes back as a -TRACE-DONE- event
+            future = executor.submit(bitmap_to_desmos_beziers, path, threshold=thr, min_length=mn, max_length=mx,
+                                     precision=prec)
+            future.add_done_callback(lambda f, kind=event: post_trace(f, kind))
+        elif event == '-TRACE-DONE-':
+            kind, future = vals[event]
+            try:
+                segs, curves, frame = future.result()
+            except Exception as e:
+                sg.popup_error(f'Tracing failed:\n{e}'); continue
+            if kind == 'Preview':
+                update_tk(canvas, curves, frame, drawn, min_px=vals['-DETAIL-'])
+            else:
+                last_output = "\n".join(segs); last_bytes = last_output.encode()
+                window['-OUT-'].update(last_output)
         elif event == 'Copy':
             txt = vals['-OUT-'];
-            if txt.strip(): copy_to_clipboard(txt); sg.popup_ok('Copied!')
+            if txt.strip(): copy_to_clipboard(window, txt); sg.popup_ok('Copied!')
             else: sg.popup_error('Nothing to copy.')
         elif event == 'Save':
             txt = vals['-OUT-'];
             if not txt.strip(): sg.popup_error('Nothing to save.'); continue
             fp = sg.popup_get_file('Save', save_as=True, no_window=True, default_extension='.txt', file_types=(('Text','*.txt'),))
-            if fp: open(fp,'w').write(txt); sg.popup_ok(f'Saved to:\n{fp}')
+            if not fp: continue
+            # Reuse the encoded Convert output unless the text was edited
+            data = last_bytes if txt == last_output else txt.encode()
+            with open(fp, 'wb', buffering=0) as f: f.write(data)
+            sg.popup_ok(f'Saved to:\n{fp}')
+    # Stop posting results before the window goes away. A trace that is already
+    # running can't be interrupted: its worker thread is joined at interpreter
+    # exit, so the process lingers until Potrace returns, then exits quietly.
+    closing.set()
+    executor.shutdown(wait=False, cancel_futures=True)
     window.close()
 
 if __name__ == '__main__':